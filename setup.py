@@ -24,6 +24,19 @@ setup(
         'sqlalchemy',
         'mysql-python',
     ],
+    extras_require = {
+        # thing.aiothing.AsyncThing
+        'async': [
+            'sqlalchemy>=1.4,<2',
+            'redis>=4.2',
+        ],
+        # python -m pytest tests, AsyncThing is tested on sqlite
+        'test': [
+            'pytest',
+            'sqlalchemy>=1.4,<2',
+            'aiosqlite',
+        ],
+    },
     classifiers = [
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
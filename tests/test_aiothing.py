@@ -0,0 +1,269 @@
+#coding=utf-8
+"""
+AsyncThing against sqlite+aiosqlite, redis is replaced by AsyncLocalRedis
+
+    pip install -e .[test]
+    python -m pytest tests
+"""
+import os
+import shutil
+import asyncio
+import tempfile
+import pytest
+
+pytest.importorskip('sqlalchemy.ext.asyncio')
+pytest.importorskip('aiosqlite')
+
+from thing import thing, benchmark
+from thing.aiothing import AsyncThing
+
+class AsyncUser(AsyncThing):
+    _tablename = 'user'
+    _has_many = {
+            'posts': {
+                'model': __name__ + '.AsyncPost',
+                'foreign_key': 'user_id',
+                },
+            }
+
+class AsyncPost(AsyncThing):
+    _tablename = 'post'
+    _query_cache_ttl = 60
+    _belongs_to = {
+            'author': {
+                'model': __name__ + '.AsyncUser',
+                'foreign_key': 'user_id',
+                },
+            }
+    _has_many = {
+            'comments': {
+                'model': __name__ + '.AsyncComment',
+                'foreign_key': 'post_id',
+                },
+            }
+
+class AsyncComment(AsyncThing):
+    _tablename = 'comment'
+    _query_cache_ttl = 60
+    _counter_caches = ('post_id', )
+    _belongs_to = {
+            'post': {
+                'model': __name__ + '.AsyncPost',
+                'foreign_key': 'post_id',
+                },
+            }
+
+class AsyncTaggedPost(AsyncThing):
+    _tablename = 'post'
+    _cache_tags = ('user_id', )
+
+class AsyncShardedPost(AsyncThing):
+    _tablename = 'post'
+    _shard_key = 'user_id'
+    _shard_map = ('post_0', 'post_1')
+
+class AsyncLocalRedis(object):
+    """
+    asyncio face of benchmark.LocalRedis, commands are run at once and awaited
+    """
+
+    def __init__(self):
+        self.redis = benchmark.LocalRedis()
+
+    def __getattr__(self, command):
+        method = getattr(self.redis, command)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+    def pipeline(self, transaction = True):
+        return AsyncLocalPipeline(self.redis.pipeline(transaction))
+
+class AsyncLocalPipeline(object):
+
+    def __init__(self, pipe):
+        self.pipe = pipe
+
+    def __getattr__(self, command):
+        return getattr(self.pipe, command)
+
+    async def execute(self):
+        return self.pipe.execute()
+
+@pytest.fixture
+def redis():
+    """
+    20 posts of 2 users and 2 comments per post in a temporary sqlite file
+    """
+    tmpdir = tempfile.mkdtemp(prefix = 'thing-test-')
+    path = os.path.join(tmpdir, 'test.db')
+    benchmark.seed('sqlite:///%s' % path, 20)
+    section = {'url': 'sqlite:///%s' % path, 'async_url': 'sqlite+aiosqlite:///%s' % path}
+    thing.Thing._table_schemas = {}
+    thing.Thing.config({
+        'db': {'master': section, 'slave': section},
+        'redis': {'client': benchmark.LocalRedis()},
+        'thing': {'debug': False},
+        })
+    AsyncThing._async_engines = {}
+    AsyncThing._async_redis = AsyncLocalRedis()
+    yield AsyncThing._async_redis.redis
+    AsyncThing._async_redis = None
+    for engine in thing.Thing._db_conn.values():
+        engine.dispose()
+    shutil.rmtree(tmpdir, ignore_errors = True)
+
+def run(coroutine):
+    async def main():
+        try:
+            return await coroutine
+        finally:
+            # engines belong to the loop they are used in
+            for engines in AsyncThing._async_engines.values():
+                for engine, _ in engines:
+                    await engine.dispose()
+            AsyncThing._async_engines = {}
+    return asyncio.run(main())
+
+def test_find(redis):
+    async def main():
+        post = await AsyncPost().find(3)
+        assert post.title == 'post 3'
+        assert redis.get(AsyncPost()._cache_key(3)) is not None
+
+        queries = redis.round_trips
+        post = await AsyncPost().find(3)
+        assert post.title == 'post 3'
+        assert redis.round_trips == queries + 1
+
+        post = await AsyncPost().find(100)
+        assert post.to_dict() == {}
+    run(main())
+
+def test_findall_by(redis):
+    async def main():
+        posts = await AsyncPost().findall_by_user_id(2, limit = 5)
+        assert [post.id for post in posts] == [19, 17, 15, 13, 11]
+        assert set(posts.get_field('user_id')) == set([2])
+
+        posts = await AsyncPost().where('user_id', '=', 1).order_by('id').findall(limit = 3, offset = 1)
+        assert [post.id for post in posts] == [4, 6, 8]
+        assert await AsyncPost().where('user_id', '=', 1).count() == 10
+    run(main())
+
+def test_save(redis):
+    async def main():
+        post = AsyncPost(user_id = 1, created = 1, content = 'new', title = 'new post')
+        pk = await post.save()
+        assert pk == 21
+        assert (await AsyncPost().find(pk)).title == 'new post'
+
+        post = await AsyncPost().find(pk)
+        post.title = 'changed'
+        await post.save()
+        assert (await AsyncPost().find(pk)).title == 'changed'
+
+        assert await (await AsyncPost().find(pk)).delete() == 1
+        assert (await AsyncPost().find(pk)).to_dict() == {}
+    run(main())
+
+def test_relations(redis):
+    async def main():
+        post = await AsyncPost().find(3)
+        author = await post.author
+        assert author.id == post.user_id
+
+        comments = await post.comments.findall()
+        assert sorted(comments.get_field('id')) == [5, 6]
+        assert await post.comments.count() == 2
+
+        posts = await AsyncPost().preload('author', 'comments').where('id', 'in', [1, 2]).findall()
+        for post in posts:
+            assert (await post.author).id == post.user_id
+            assert len((await post.comments.findall()).to_list()) == 2
+    run(main())
+
+def test_gather(redis):
+    async def main():
+        posts = await asyncio.gather(*[AsyncPost().find(pk) for pk in range(1, 11)])
+        assert [post.title for post in posts] == ['post %d' % pk for pk in range(1, 11)]
+
+        # the same missed row is loaded once
+        redis.flushdb()
+        posts = await asyncio.gather(*[AsyncPost().find(5) for _ in range(5)])
+        assert set(post.title for post in posts) == set(['post 5'])
+    run(main())
+
+def test_insert_many(redis):
+    async def main():
+        assert await AsyncComment().count_by_post_id(3) == 2
+        generation = redis.get(AsyncComment()._generation_key())
+
+        pks = await AsyncComment().insert_many([{'user_id': 1, 'post_id': 3, 'content': 'more'}])
+        assert pks == [41]
+        assert await AsyncComment().count_by_post_id(3) == 3
+        assert redis.get(AsyncComment()._cache_key(41)) is not None
+        assert redis.get(AsyncComment()._generation_key()) != generation
+    run(main())
+
+def test_iter_chunks(redis):
+    async def main():
+        chunks = []
+        async for posts in AsyncPost().where('user_id', '=', 1).iter_chunks(size = 4):
+            chunks.append(posts.get_field('id'))
+        assert [len(chunk) for chunk in chunks] == [4, 4, 2]
+
+        columns = await AsyncPost().select(['id', 'created']).order_by('id').to_columns(limit = 3)
+        assert list(columns['id']) == [1, 2, 3]
+    run(main())
+
+def test_count_many(redis):
+    async def main():
+        assert await AsyncComment().count_many('post_id', [1, 2, 100]) == {1: 2, 2: 2, 100: 0}
+        assert redis.get(AsyncComment()._counter_key('post_id', 1)) is not None
+        # counters are read back from cache
+        assert await AsyncComment().count_many('post_id', [1, 2, 100]) == {1: 2, 2: 2, 100: 0}
+        assert await AsyncComment().where('user_id', '=', 1).count_many('post_id', ['1', 3]) == {'1': 1, 3: 1}
+    run(main())
+
+def test_cache_tags(redis):
+    async def main():
+        post = await AsyncTaggedPost().find(2)
+        assert redis.get(AsyncTaggedPost()._cache_key(2)) is not None
+        await AsyncTaggedPost().where('user_id', '=', post.user_id).updateall(title = 'changed')
+        assert (await AsyncTaggedPost().find(2)).title == 'changed'
+
+        # the tag is bumped while the row is loaded, the old row is not cached
+        redis.flushdb()
+        model = AsyncTaggedPost()
+        read = model._read
+
+        async def racy_read(*args, **kwargs):
+            result = await read(*args, **kwargs)
+            await AsyncTaggedPost().where('user_id', '=', post.user_id).updateall(title = 'again')
+            return result
+        model._read = racy_read
+        assert (await model.find(2)).title == 'changed'
+        assert redis.get(AsyncTaggedPost()._cache_key(2)) is None
+        assert (await AsyncTaggedPost().find(2)).title == 'again'
+    run(main())
+
+def test_save_counted_unloaded(redis):
+    async def main():
+        assert await AsyncComment().count_many('post_id', [1, 3]) == {1: 2, 3: 2}
+        # the old post_id is selected before the update
+        await AsyncComment(id = 1, post_id = 3).save()
+        assert await AsyncComment().count_many('post_id', [1, 3]) == {1: 1, 3: 3}
+    run(main())
+
+def test_shard_key_change(redis):
+    async def main():
+        # both shards are the test database here
+        for shard in AsyncShardedPost._shard_map:
+            thing.Thing._config['db']['%s.master' % shard] = thing.Thing._config['db']['master']
+        post = await AsyncShardedPost().where('user_id', '=', 1).find()
+        post.user_id = 2
+        with pytest.raises(thing.ThingException):
+            await post.save()
+    run(main())
@@ -0,0 +1,29 @@
+#coding=utf-8
+"""
+usage: python -m thing schema <config module> <path> [table ...]
+       python -m thing bench [--url URL] [--rows N] [--iterations N] [--output PATH]
+
+<config module> is the module which calls Thing.config(), e.g. conn.
+tables schema (all tables of slave sections if no table is given) is saved
+into <path>, set config['thing']['schema_snapshot'] to load it on startup.
+
+bench runs thing.benchmark, see its docstring.
+"""
+from __future__ import absolute_import, print_function
+import sys
+from thing import thing
+
+def main(argv):
+    if len(argv) > 1 and argv[1] == 'bench':
+        from thing import benchmark
+        return benchmark.main(argv[2:])
+    if len(argv) < 4 or argv[1] != 'schema':
+        print(__doc__.strip())
+        return 1
+    __import__(argv[2])
+    thing.Thing.dump_schema(argv[3], argv[4:] or None)
+    print('%d tables saved into %s' % (len(thing.Thing._table_schemas), argv[3]))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,736 @@
+#coding=utf-8
+"""
+asyncio version of Thing, needs python 3.7+, sqlalchemy 1.4 (not 2.0) with an
+async driver (e.g. mysql+aiomysql, sqlite+aiosqlite) and redis-py 4.2+
+
+    from thing.aiothing import AsyncThing
+
+    class Post(AsyncThing):
+        _belongs_to = {
+                'author': {
+                    'model': 'models.user.User',
+                    'foreign_key': 'user_id',
+                    }
+                }
+
+    post = await Post().find(1)
+    author = await post.author
+    posts = await Post().findall_by_user_id(3, limit = 20)
+    comments = await post.comments.findall()
+    post.title = 'foo'
+    await post.save()
+
+config is shared with Thing, a db section uses 'async_url' if it's set, else 'url'.
+table schema is reflected with the blocking engine the first time a model is
+used, set config['thing']['warmup'] or 'schema_snapshot' to keep it off the loop.
+
+a field in _deferred_fields which is not loaded yet is awaited like a relation,
+e.g. `content = await post.content`, or use `await posts.load_deferred()`.
+
+models with _shard_map are routed to their shards like Thing, but reads without
+the shard key raise ThingException instead of reading every shard.
+
+AsyncThing._async_redis can be replaced by another asyncio redis client,
+e.g. a local stand-in in tests.
+"""
+import json
+import time
+import random
+import asyncio
+from sqlalchemy import and_
+from sqlalchemy.ext.asyncio import create_async_engine
+try:
+    import redis.asyncio as aioredis
+except ImportError as e:
+    aioredis = None
+from .thing import Thing, Statement, AttributeDict, ThingException, _MISSING, _NOT_FOUND, _INCR_IF_EXISTS
+
+class AsyncThing(Thing):
+
+    # section => [(engine, weight)]
+    _async_engines = {}
+
+    _async_redis = None
+
+    # cache keys of rows going to be deleted, used by _before_delete
+    _tobe_deleted_keys = []
+
+    # or tag generations to bump, when filters are on _cache_tags
+    _tobe_deleted_tags = []
+
+    # cache key => future of the row being loaded by find(), see _single_flight
+    _async_flights = {}
+
+    # counter keys dropped after updateall() / filtered delete()
+    _tobe_expired_counters = []
+
+    @staticmethod
+    def _get_async_engine(section):
+        engines = AsyncThing._async_engines.get(section)
+        if engines is None:
+            configs = Thing._config['db'][section]
+            if not isinstance(configs, list):
+                configs = [configs]
+            engines = []
+            for config in configs:
+                kwargs = {k:v for k, v in config.items() if k not in ('url', 'async_url', 'weight', 'max_lag')}
+                engines.append((create_async_engine(config.get('async_url', config['url']), **kwargs), config.get('weight', 1)))
+            AsyncThing._async_engines[section] = engines
+        if len(engines) == 1:
+            return engines[0][0]
+        return random.choices([engine for engine, _ in engines], weights = [weight for _, weight in engines])[0]
+
+    @staticmethod
+    def _redis():
+        if not Thing._config.get('redis'):
+            return None
+        if AsyncThing._async_redis is None:
+            if aioredis is None:
+                raise ThingException('redis-py 4.2+ is required by AsyncThing')
+            config = Thing._config['redis']
+            AsyncThing._async_redis = aioredis.StrictRedis(host=config['host'], port=config['port'], db=config['db'])
+        return AsyncThing._async_redis
+
+    def _engine(self, is_read, row = None):
+        # shards are routed like Thing, but not read in parallel
+        return AsyncThing._get_async_engine(Thing._get_section(self._route(row), is_read))
+
+    @staticmethod
+    def _to_item(row):
+        if row is None:
+            return {}
+        return AttributeDict(row._mapping if hasattr(row, '_mapping') else row.items())
+
+    async def _execute(self, conn, query, operation = None):
+        if not isinstance(query, Statement):
+            query = Statement(query)
+        if query.cached:
+            conn = await conn.execution_options(compiled_cache = Statement.compiled_cache)
+        start_time = time.time()
+        result = await conn.execute(query.statement, query.params)
+        self._emit_query(operation, query, start_time, result.rowcount)
+        return result
+
+    async def _read(self, query, operation = None, row = None):
+        async with self._engine(True, row).connect() as conn:
+            return await self._execute(conn, query, operation)
+
+    def __getattr__(self, key):
+        if key in self._belongs_to and key not in self._unsaved_items and key not in self._current_item:
+            return self._belongs_to_model(key)
+        if (key in self._deferred_fields and key not in self._unsaved_items and key not in self._current_item
+                and self._primary_key in self._current_item):
+            return self._deferred_value(key)
+        return Thing.__getattr__(self, key)
+
+    async def _deferred_value(self, key):
+        self._current_item = (await self._with_deferred([self._current_item], self._deferred_fields))[0]
+        if 0 <= self._current_index < len(self._results):
+            self._results[self._current_index] = self._current_item
+        value = self._current_item[key]
+        return '' if value is None else value
+
+    async def load_deferred(self, *fields):
+        fields = fields or self._deferred_fields
+        if self._results:
+            self._results = await self._with_deferred(self._results, fields)
+            if 0 <= self._current_index < len(self._results):
+                self._current_item = self._results[self._current_index]
+        elif self._current_item:
+            self._current_item = (await self._with_deferred([self._current_item], fields))[0]
+        return self
+
+    async def _with_deferred(self, rows, fields):
+        query = self._deferred_query(rows, fields)
+        results = (await self._read(query, 'deferred', rows[0] if len(rows) == 1 else None)).fetchall()
+        return self._merge_deferred(rows, fields, results)
+
+    async def _belongs_to_model(self, key):
+        model = self._relation_model(self._belongs_to[key])
+        fk_val = getattr(self, self._belongs_to[key]['foreign_key'])
+        if key in self._preloaded:
+            model._current_item = self._preloaded[key].get(fk_val, {})
+            return model
+        model._relation_source = '%s.%s' % (self.__class__.__name__, key)
+        return await model.find(fk_val)
+
+    __next__ = Thing.next
+
+    async def _after_insert(self):
+        await self._cache_current_item()
+        await self._adjust_counters([(None, self._counter_values(self._current_item))])
+
+    async def _cache_current_item(self):
+        key_name = self._cache_key(self._current_item[self._primary_key])
+        redis = AsyncThing._redis()
+        if redis is not None:
+            generations = await self._fresh_generations(self._tag_keys(self._current_item) or [], self._tag_sequence)
+            data = None if generations is None else self._encode_row(self._current_item, generations)
+            if data is None:
+                await redis.delete(key_name)
+            else:
+                await redis.set(key_name, data, ex = self._cache_ttl or None)
+        await self._invalidate_local_cache([key_name])
+
+    async def _after_update(self):
+        if self._current_item:
+            await self._cache_current_item()
+            await self._adjust_counters(self._saved_counter_changes())
+        await self._expire_counters()
+
+    async def _before_delete(self):
+        if self._tobe_deleted_tags:
+            await self._bump_tags(self._tobe_deleted_tags)
+        else:
+            await self._delete_cache(self._tobe_deleted_keys)
+
+    async def _after_delete(self):
+        if self._primary_key in self._current_item:
+            await self._adjust_counters([(self._counter_values(self._current_item), None)])
+        await self._expire_counters()
+
+    async def _adjust_counters(self, changes):
+        redis = AsyncThing._redis()
+        if not self._counter_caches or redis is None:
+            return
+        deltas, expired = self._counter_changes(changes)
+        if not deltas and not expired:
+            return
+        pipe = redis.pipeline(transaction = False)
+        for key, delta in deltas.items():
+            pipe.eval(_INCR_IF_EXISTS, 1, key, delta)
+        if expired:
+            pipe.delete(*expired)
+        await pipe.execute()
+
+    async def _bulk_counters(self, conn, fields, values = None):
+        keys, query = self._bulk_counter_query(fields, values)
+        if query is not None:
+            rows = (await self._execute(conn, query, 'count')).fetchall()
+            keys.extend(self._parent_counter_keys([self._to_item(row) for row in rows]))
+        return keys
+
+    async def _expire_counters(self):
+        keys, self._tobe_expired_counters = self._tobe_expired_counters, []
+        redis = AsyncThing._redis()
+        if keys and redis is not None:
+            await redis.delete(*keys)
+
+    async def _delete_cache(self, keys):
+        if not keys:
+            return
+        redis = AsyncThing._redis()
+        if redis is not None:
+            pipe = redis.pipeline(transaction = False)
+            for i in range(0, len(keys), self._invalidation_chunk_size):
+                pipe.unlink(*keys[i:i + self._invalidation_chunk_size])
+            await pipe.execute()
+        await self._invalidate_local_cache(keys)
+
+    async def _bump_tags(self, tag_keys):
+        redis = AsyncThing._redis()
+        if redis is not None:
+            pipe = redis.pipeline(transaction = False)
+            pipe.incr(self._tag_sequence_key())
+            for key in tag_keys:
+                pipe.incr(key)
+            await pipe.execute()
+        await self._invalidate_local_cache([self._cache_key('*')])
+
+    async def _tag_generations(self, keys):
+        if not self._cache_tags or not keys:
+            return {}
+        return Thing._generations(keys, await AsyncThing._redis().mget(keys))
+
+    async def _read_tag_sequences(self, models):
+        keys = [model._tag_sequence_key() for model in models if model._cache_tags]
+        redis = AsyncThing._redis()
+        if not keys or redis is None:
+            return [None] * len(models)
+        return Thing._sequences(models, await redis.mget(keys))
+
+    async def _fresh_generations(self, keys, sequence):
+        if not self._cache_tags:
+            return {}
+        if sequence is None:
+            return None
+        return self._checked_generations(keys, await AsyncThing._redis().mget([self._tag_sequence_key()] + keys), sequence)
+
+    async def _before_find(self, val):
+        key_name = self._cache_key(val)
+        result = self._local_cache_get(key_name)
+        if result is not None:
+            return result
+
+        redis = AsyncThing._redis()
+        if redis is not None:
+            start_time = time.time()
+            pttl = None
+            if (self._cache_ttl and self._cache_early_refresh) or self._cache_tags:
+                pipe = redis.pipeline(transaction = False)
+                pipe.get(key_name)
+                pipe.pttl(key_name)
+                if self._cache_tags:
+                    pipe.get(self._tag_sequence_key())
+                results = await pipe.execute()
+                result, pttl = results[:2]
+                if self._cache_tags:
+                    self._tag_sequence = int(results[2] or 0)
+            else:
+                result = await redis.get(key_name)
+            if result == _MISSING:
+                self._emit_cache('find', key_name, start_time, True)
+                return _NOT_FOUND
+            if result:
+                result, tagged = self._decode_row(result)
+                if tagged and Thing._is_stale(tagged, await self._tag_generations(list(tagged))):
+                    result = None
+            return self._cache_hit(key_name, result, pttl, start_time)
+
+    async def _after_find(self, val):
+        if not self._current_item:
+            if val and self._negative_cache_ttl:
+                await self._cache_missing([val])
+            return
+        key_name = self._found_key(val)
+        if key_name is None:
+            return
+        item = self.to_dict()
+        redis = AsyncThing._redis()
+        if redis is not None:
+            generations = await self._fresh_generations(self._tag_keys(self._current_item) or [], self._tag_sequence)
+            if generations is None:
+                self._cache_refresh = False
+                return
+            data = self._encode_row(self._current_item, generations)
+            if data is not None:
+                await redis.set(key_name, data, ex = self._cache_ttl or None,
+                        nx = not self._cache_tags and not self._cache_refresh)
+        self._cache_refresh = False
+        self._local_cache_set(key_name, item)
+
+    async def _cache_missing(self, vals):
+        redis = AsyncThing._redis()
+        if redis is None or not vals:
+            return
+        pipe = redis.pipeline(transaction = False)
+        for val in vals:
+            pipe.set(self._cache_key(val), _MISSING, ex = self._negative_cache_ttl, nx = True)
+        await pipe.execute()
+
+    async def _invalidate_local_cache(self, keys):
+        if not keys or not self._local_cache_ttl or Thing._local_cache is None:
+            return
+        Thing._local_cache.delete(*keys)
+        redis = AsyncThing._redis()
+        if redis is not None:
+            await redis.publish(Thing._invalidation_channel, json.dumps(keys))
+
+    async def _before_findall(self, query):
+        return await self._query_cache_get(query)
+
+    async def _after_findall(self, query):
+        if self._query_cache_ttl:
+            await self._query_cache_set(query, [dict(row) for row in self._results])
+
+    async def _query_cache_get(self, query):
+        redis = AsyncThing._redis()
+        if not self._query_cache_ttl or redis is None:
+            return None
+        key_name = self._query_cache_key(query)
+        start_time = time.time()
+        generation, result = await redis.mget([self._generation_key(), key_name])
+        return self._query_cache_value(key_name, generation, result, start_time)
+
+    async def _query_cache_set(self, query, value):
+        redis = AsyncThing._redis()
+        if not self._query_cache_ttl or redis is None:
+            return
+        await redis.setex(self._query_cache_key(query), self._query_cache_ttl, self._query_cache_data(value))
+
+    async def _bump_generation(self):
+        redis = AsyncThing._redis()
+        if self._query_cache_ttl and redis is not None:
+            await redis.incr(self._generation_key())
+
+    async def find(self, val = None):
+        if val:
+            result = await self._before_find(val)
+            if result is _NOT_FOUND:
+                self._current_item = {}
+                self._reset_query()
+                return self
+            if result:
+                self._current_item = result
+                return self
+            query = self._find_statement(val)
+            self._current_item = await self._load_once(val, lambda: self._find_query(query, val))
+        else:
+            self._tag_sequence = (await self._read_tag_sequences([self]))[0]
+            await self._find_query(self._find_statement(val), val)
+
+        self._reset_query()
+        return self
+
+    async def _find_query(self, query, val):
+        start_time = time.time()
+        self._current_item = self._to_item((await self._read(query, 'find', {self._primary_key: val} if val else None)).first())
+        if val:
+            self._record_load_cost(start_time)
+        await self._after_find(val)
+        return self._current_item
+
+    async def _load_once(self, val, load):
+        """
+        load a missed row once, other tasks wait for the future of the first one
+        """
+        if not self._single_flight:
+            return await load()
+
+        key_name = self._cache_key(val)
+        flight = AsyncThing._async_flights.get(key_name)
+        if flight is not None and flight.get_loop() is asyncio.get_event_loop():
+            try:
+                row = await asyncio.wait_for(asyncio.shield(flight), self._single_flight_timeout)
+            except Exception:
+                return await load()
+            return AttributeDict(row) if row else {}
+
+        flight = AsyncThing._async_flights[key_name] = asyncio.get_event_loop().create_future()
+        lock_key = None
+        try:
+            row, lock_key = await self._wait_cache_lock(val, key_name)
+            if row is None:
+                row = await load()
+            flight.set_result(self._row_to_dict(row) if row else {})
+            return row
+        except Exception as e:
+            flight.set_exception(e)
+            # nobody may wait for it
+            flight.exception()
+            raise
+        finally:
+            if AsyncThing._async_flights.get(key_name) is flight:
+                del AsyncThing._async_flights[key_name]
+            if lock_key:
+                await AsyncThing._redis().delete(lock_key)
+
+    async def _wait_cache_lock(self, val, key_name):
+        redis = AsyncThing._redis()
+        if not self._cache_lock_timeout or redis is None:
+            return None, None
+        lock_key = 'thing.lock.%s' % key_name
+        deadline = time.time() + self._cache_lock_timeout
+        while not await redis.set(lock_key, 1, px = int(self._cache_lock_timeout * 1000), nx = True):
+            if time.time() > deadline:
+                return None, None
+            await asyncio.sleep(0.01)
+            row = await self._before_find(val)
+            if row is _NOT_FOUND:
+                return {}, None
+            if row:
+                return row, None
+        return None, lock_key
+
+    async def findall(self, limit = -1, offset = 0, after = None):
+        if self._preloaded_results is not None and limit == -1 and offset == 0 and not after:
+            self._results = self._preloaded_results
+            self._reset_query()
+            return self
+
+        query = self._findall_statement(limit, offset, after)
+        result = None if self._join_relations else await self._before_findall(query)
+
+        joined = None
+        if result is not None:
+            self._results = result
+        elif self._join_relations:
+            sequences = await self._read_tag_sequences(self._joined_models())
+            self._results, joined = self._split_joined((await self._read(query, 'findall')).fetchall())
+            await self._cache_joined(joined, sequences)
+        else:
+            self._results = [self._to_item(row) for row in (await self._read(query, 'findall')).fetchall()]
+            await self._after_findall(query)
+
+        self._set_next_cursor(limit)
+        if self._preload_relations:
+            await self._preload()
+        self._add_joined(joined)
+
+        self._reset_query()
+        return self
+
+    async def iter_chunks(self, size = 5000, limit = -1, offset = 0):
+        """
+        async generator of findall() results read chunk by chunk from a streamed cursor, e.g.
+
+        async for posts in Post().where('user_id', '=', 3).iter_chunks(size = 1000):
+            ...
+        """
+        query = self._findall_query(limit, offset)
+        async with self._engine(True).connect() as conn:
+            start_time = time.time()
+            result = await conn.stream(query.statement, query.params)
+            self._emit_query('iter_chunks', query, start_time)
+            self._reset_query()
+            async for rows in result.partitions(size):
+                self._results = [self._to_item(row) for row in rows]
+                self._current_index = -1
+                if self._preload_relations:
+                    await self._preload()
+                yield self
+        self._results = []
+
+    async def to_columns(self, limit = -1, offset = 0, chunk_size = 5000):
+        query = self._findall_query(limit, offset)
+        async with self._engine(True).connect() as conn:
+            start_time = time.time()
+            result = await conn.stream(query.statement, query.params)
+            self._reset_query()
+            names = list(result.keys())
+            buffers = [self._column_buffer(name) for name in names]
+            rowcount = 0
+            async for rows in result.partitions(chunk_size):
+                rowcount += len(rows)
+                self._extend_columns(buffers, rows)
+            self._emit_query('to_columns', query, start_time, rowcount)
+        return self._make_columns(names, buffers)
+
+    async def _cache_joined(self, joined, sequences):
+        models = self._joined_models()
+        if self._selected_names is None:
+            await self._cache_rows(self._results, sequences[0])
+        for model, sequence, relation in zip(models[1:], sequences[1:], self._join_relations):
+            await model._cache_rows(list(joined[relation].values()), sequence)
+
+    async def count(self):
+        counter = self._counter_filter()
+        if counter is not None:
+            result = (await self._count_many(counter[0], [counter[1]], []))[counter[1]]
+            self._reset_query()
+            return result
+
+        query = self._count_statement()
+        result = await self._query_cache_get(query)
+        if result is None:
+            result = (await self._read(query, 'count')).scalar()
+            await self._query_cache_set(query, result)
+        return result
+
+    def _buffer(self, val, increments, values):
+        # the write buffer is flushed by a thread with the blocking engine
+        raise ThingException('buffer_incr() / buffer_set() are not supported by AsyncThing')
+
+    async def count_many(self, field, vals):
+        counts = await self._count_many(field, list(set(vals)), self._filters)
+        self._reset_query()
+        return counts
+
+    async def _count_many(self, field, vals, filters):
+        counts = {}
+        missing = vals
+        redis = AsyncThing._redis()
+        cached = field in self._counter_caches and not filters and redis is not None
+        if cached and vals:
+            start_time = time.time()
+            counts, missing = self._cached_counts(vals, await redis.mget([self._counter_key(field, val) for val in vals]))
+            self._emit_cache('count', self._counter_key(field, '*'), start_time,
+                    hits = len(counts), misses = len(missing))
+
+        if missing:
+            results = (await self._read(self._count_many_query(field, missing, filters), 'count')).fetchall()
+            self._merge_counts(counts, missing, results)
+            if cached:
+                pipe = redis.pipeline(transaction = False)
+                for val in missing:
+                    pipe.set(self._counter_key(field, val), counts[val], ex = self._counter_cache_ttl or None, nx = True)
+                await pipe.execute()
+        return counts
+
+    async def find_many(self, vals):
+        rows = await self._fetch_by_pks(set(vals))
+        self._results = [rows[val] for val in vals if val in rows]
+        self._current_index = -1
+        if self._preload_relations:
+            await self._preload()
+        return self
+
+    async def _preload(self):
+        self._preloaded = {}
+        relations = list(self._preload_relations)
+        # relations are independent, so load them concurrently
+        results = await asyncio.gather(*[self._preload_relation(relation) for relation in relations])
+        self._preloaded = dict(zip(relations, results))
+
+    async def _preload_relation(self, relation):
+        model, foreign_key, vals = self._preload_keys(relation)
+        if relation in self._belongs_to:
+            return await model._fetch_by_pks(vals)
+        if not vals:
+            return {}
+        rows = (await model.where(foreign_key, 'in', list(vals)).findall())._results
+        return Thing._group_rows(rows, foreign_key)
+
+    async def _fetch_by_pks(self, vals):
+        vals = list(vals)
+        rows = {}
+        if not vals:
+            return rows
+
+        missing = vals
+        sequence = None
+        redis = AsyncThing._redis()
+        if redis is not None:
+            start_time = time.time()
+            keys = [self._cache_key(val) for val in vals]
+            if self._cache_tags:
+                keys.append(self._tag_sequence_key())
+            results = await redis.mget(keys)
+            if self._cache_tags:
+                sequence = int(results.pop() or 0)
+            rows, tagged, missing = self._cached_rows(vals, results)
+            if self._cache_tags and rows:
+                self._drop_stale(rows, tagged, missing, await self._tag_generations(self._rows_tag_keys(rows.values())))
+            self._emit_cache('find_many', self._cache_key('*'), start_time, hits = len(rows), misses = len(missing))
+
+        if missing:
+            results = [self._to_item(row) for row in (await self._read(self._read_back_query(missing), 'find_many')).fetchall()]
+            self._add_loaded(rows, missing, results)
+            await self._cache_rows(results, sequence)
+            if self._negative_cache_ttl:
+                await self._cache_missing([val for val in missing if val not in rows])
+        return rows
+
+    async def _cache_rows(self, rows, sequence):
+        redis = AsyncThing._redis()
+        if redis is None or not rows:
+            return
+        generations = await self._fresh_generations(self._rows_tag_keys(rows), sequence)
+        pipe = redis.pipeline(transaction = False)
+        for key_name, data in self._encoded_rows(rows, generations):
+            if data is None:
+                pipe.delete(key_name)
+            else:
+                pipe.set(key_name, data, ex = self._cache_ttl or None)
+        await pipe.execute()
+
+    async def save(self):
+        self._fill_unsaved()
+        is_insert = self._primary_key not in self._unsaved_items
+        self._tag_sequence = (await self._read_tag_sequences([self]))[0]
+        async with self._engine(False, self._unsaved_items).connect() as conn:
+            query, primary_key_val = self._save_query(conn)
+            counted = None if is_insert else self._counted_query(primary_key_val)
+            if counted is not None:
+                self._add_counted(self._to_item((await self._execute(conn, counted, 'counted')).first()) or None)
+            result = await self._execute(conn, query, 'insert' if is_insert else 'update')
+
+            if self._save_returning(conn):
+                self._current_item = self._to_item(result.first())
+                primary_key_val = self._current_item[self._primary_key]
+            else:
+                if is_insert:
+                    primary_key_val = result.inserted_primary_key[0]
+                self._current_item = await self._saved_item(conn, primary_key_val, self._unsaved_items, is_insert)
+            await conn.commit()
+
+        if is_insert:
+            await self._after_insert()
+        else:
+            await self._after_update()
+        self._unsaved_items = {}
+        await self._bump_generation()
+        return primary_key_val
+
+    async def _saved_item(self, conn, primary_key_val, values, is_insert):
+        item = None
+        if not self._save_read_back:
+            item = self._local_item(dict(values, **{self._primary_key: primary_key_val}), is_insert)
+        if item is None:
+            query = self._read_back_query(primary_key_val)
+            item = self._to_item((await self._execute(conn, query, 'read_back')).first())
+        return item
+
+    async def insert_many(self, rows, chunk_size = 1000, read_back = True):
+        if self._shard_map and self._shard is None:
+            rows = list(rows)
+            pks = [None] * len(rows)
+            for shard, indexes in self._shard_groups(rows).items():
+                model = self.__class__().use_shard(shard)
+                for i, pk in zip(indexes, await model.insert_many([rows[i] for i in indexes], chunk_size, read_back)):
+                    pks[i] = pk
+            return pks
+
+        items, instances = self._insert_items(rows)
+        pks = []
+        inserted = []
+        sequence = (await self._read_tag_sequences([self]))[0] if read_back else None
+        async with self._engine(False).connect() as conn:
+            for i in range(0, len(items), chunk_size):
+                chunk = items[i:i + chunk_size]
+                start_time = time.time()
+                first_pk = (await conn.execute(self.table.insert().values(chunk))).lastrowid
+                self._emit_query('insert_many', 'INSERT INTO %s (%d rows)' % (self._tablename, len(chunk)),
+                        start_time, len(chunk), False)
+                chunk_pks = self._chunk_pks(conn, first_pk, chunk)
+                pks.extend(chunk_pks)
+                if read_back:
+                    results = (await self._execute(conn, self._read_back_query(chunk_pks), 'read_back')).fetchall()
+                    inserted.extend(self._to_item(result) for result in results)
+            await conn.commit()
+
+        if read_back:
+            await self._cache_rows(inserted, sequence)
+            self._set_inserted(instances, pks, inserted)
+        elif self._negative_cache_ttl:
+            # drop negative cache entries of new rows
+            await self._delete_cache([self._cache_key(pk_val) for pk_val in pks])
+        await self._adjust_counters([(None, self._counter_values(item)) for item in items])
+        if items:
+            await self._bump_generation()
+        return pks
+
+    async def delete(self):
+        async with self._engine(False, self._current_item).connect() as conn:
+            if self._primary_key in self._current_item:
+                pk_val = self._current_item[self._primary_key]
+                self._tobe_deleted_keys = [self._cache_key(pk_val)]
+                query = self.table.delete().where(getattr(self.table.c, self._primary_key) == pk_val)
+            else:
+                self._tobe_deleted_tags = self._filter_tags()
+                if self._tobe_deleted_tags is None:
+                    rows = (await self._execute(conn, self._filtered_pks_query(), 'delete')).fetchall()
+                    self._tobe_deleted_keys = [self._cache_key(row[0]) for row in rows]
+                if self._counter_caches:
+                    self._tobe_expired_counters = await self._bulk_counters(conn, self._counter_caches)
+                query = self.table.delete(and_(*self._filters))
+            await self._before_delete()
+            self._tobe_deleted_keys = []
+            self._tobe_deleted_tags = []
+            rowcount = (await self._execute(conn, query, 'delete')).rowcount
+            await conn.commit()
+
+        await self._after_delete()
+        await self._bump_generation()
+        return rowcount
+
+    async def updateall(self, **fields):
+        tags = self._filter_tags()
+        async with self._engine(False).connect() as conn:
+            if tags is None:
+                rows = (await self._execute(conn, self._filtered_pks_query(), 'updateall')).fetchall()
+                keys = [self._cache_key(row[0]) for row in rows]
+            counted = [field for field in self._counter_caches if field in fields]
+            if counted:
+                self._tobe_expired_counters = await self._bulk_counters(conn, counted, fields)
+
+            rowcount = (await self._execute(conn, self._updateall_query(fields), 'updateall')).rowcount
+            await conn.commit()
+
+        if tags is None:
+            await self._delete_cache(keys)
+        else:
+            await self._bump_tags(tags)
+        await self._expire_counters()
+        await self._bump_generation()
+        return rowcount
@@ -0,0 +1,372 @@
+#coding=utf-8
+"""
+benchmark of Thing hot paths, results are printed or saved as json so they can
+be compared between versions:
+
+    python -m thing bench [--url URL] [--rows N] [--iterations N] [--output PATH]
+
+tables user / post / comment of README are created and seeded in a temporary
+sqlite file, or in URL (e.g. a scratch mysql database, its user / post / comment
+tables are DROPPED first). redis is replaced by LocalRedis, an in-process
+stand-in which counts round trips.
+
+each operation is run with a cold cache (redis flushed, every row read once)
+and a warm one (the same rows again), write operations only once. reported per
+operation: throughput, p50 / p99 latency, queries and redis round trips per call.
+"""
+from __future__ import absolute_import, print_function
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import tempfile
+import threading
+import timeit
+import sqlalchemy
+from sqlalchemy import MetaData, Table, Column, Integer, String, Text, create_engine
+import thing as package
+from thing import thing
+
+class User(thing.Thing):
+    _has_many = {
+            'posts': {
+                'model': 'thing.benchmark.Post',
+                'foreign_key': 'user_id',
+                },
+            }
+
+class Post(thing.Thing):
+    _query_cache_ttl = 60
+    _belongs_to = {
+            'author': {
+                'model': 'thing.benchmark.User',
+                'foreign_key': 'user_id',
+                },
+            }
+    _has_many = {
+            'comments': {
+                'model': 'thing.benchmark.Comment',
+                'foreign_key': 'post_id',
+                },
+            }
+
+class Comment(thing.Thing):
+    _belongs_to = {
+            'post': {
+                'model': 'thing.benchmark.Post',
+                'foreign_key': 'post_id',
+                },
+            'author': {
+                'model': 'thing.benchmark.User',
+                'foreign_key': 'user_id',
+                },
+            }
+
+class LocalRedis(object):
+    """
+    in-process stand-in of the redis commands used by Thing, values are kept
+    as bytes like redis-py returns them. round_trips counts commands sent,
+    a pipeline counts once
+    """
+
+    def __init__(self):
+        self.round_trips = 0
+        self._items = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _bytes(value):
+        if isinstance(value, bytes):
+            return value
+        if not isinstance(value, type(u'')):
+            value = '%s' % value
+        return value.encode('utf-8')
+
+    def _alive(self, name):
+        item = self._items.get(name)
+        if item is not None and item[1] is not None and item[1] <= time.time():
+            del self._items[name]
+            item = None
+        return item
+
+    def _get(self, name):
+        item = self._alive(name)
+        return item[0] if item else None
+
+    def _set(self, name, value, ex = None, px = None, nx = False):
+        if nx and self._alive(name):
+            return None
+        expire = None
+        if ex:
+            expire = time.time() + ex
+        elif px:
+            expire = time.time() + px / 1000.0
+        self._items[name] = (self._bytes(value), expire)
+        return True
+
+    def _setex(self, name, ttl, value):
+        return self._set(name, value, ex = ttl)
+
+    def _delete(self, *names):
+        return len([self._items.pop(name) for name in names if self._alive(name)])
+
+    def _mget(self, keys, *args):
+        return [self._get(key) for key in list(keys) + list(args)]
+
+    def _incr(self, name, amount = 1):
+        value = int(self._get(name) or 0) + amount
+        item = self._alive(name)
+        self._items[name] = (self._bytes(value), item[1] if item else None)
+        return value
+
+    def _pttl(self, name):
+        item = self._alive(name)
+        if item is None:
+            return -2
+        if item[1] is None:
+            return -1
+        return int((item[1] - time.time()) * 1000)
+
+    def _publish(self, channel, message):
+        return 0
+
+    def _eval(self, script, numkeys, *args):
+        # lua is not run here, only the scripts of Thing are known
+        if script != thing._INCR_IF_EXISTS:
+            raise NotImplementedError('unknown script: %s' % script)
+        if self._alive(args[0]):
+            return self._incr(args[0], int(args[1]))
+        return None
+
+    def _execute_command(self, *args):
+        return getattr(self, '_' + args[0].lower())(*args[1:])
+
+    _unlink = _delete
+
+    def _run(self, command, *args, **kwargs):
+        with self._lock:
+            self.round_trips += 1
+            return getattr(self, '_' + command)(*args, **kwargs)
+
+    def __getattr__(self, command):
+        if not hasattr(LocalRedis, '_' + command):
+            raise AttributeError(command)
+        return lambda *args, **kwargs: self._run(command, *args, **kwargs)
+
+    def pipeline(self, transaction = True):
+        return LocalPipeline(self)
+
+    def pubsub(self):
+        return LocalPubSub()
+
+    def flushdb(self):
+        with self._lock:
+            self._items.clear()
+
+class LocalPipeline(object):
+
+    def __init__(self, redis):
+        self._redis = redis
+        self._commands = []
+
+    def __getattr__(self, command):
+        if not hasattr(LocalRedis, '_' + command):
+            raise AttributeError(command)
+        return lambda *args, **kwargs: self._commands.append((command, args, kwargs))
+
+    def execute(self):
+        with self._redis._lock:
+            self._redis.round_trips += 1
+            results = [getattr(self._redis, '_' + command)(*args, **kwargs) for command, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+class LocalPubSub(object):
+    """
+    no other process shares a LocalRedis, so there is no message to listen to
+    """
+
+    def subscribe(self, *channels):
+        pass
+
+    def listen(self):
+        return iter(())
+
+def create_schema(url):
+    metadata = MetaData()
+    Table('user', metadata,
+            Column('id', Integer, primary_key = True),
+            Column('name', String(30)))
+    Table('post', metadata,
+            Column('id', Integer, primary_key = True),
+            Column('user_id', Integer, index = True),
+            Column('created', Integer),
+            Column('content', Text),
+            Column('title', String(255)))
+    Table('comment', metadata,
+            Column('id', Integer, primary_key = True),
+            Column('user_id', Integer, index = True),
+            Column('post_id', Integer, index = True),
+            Column('content', Text))
+    engine = create_engine(url)
+    metadata.drop_all(engine)
+    metadata.create_all(engine)
+    return engine, metadata
+
+def seed(url, rows):
+    """
+    rows posts by rows / 10 users, 2 comments per post
+    """
+    engine, metadata = create_schema(url)
+    users = max(rows // 10, 1)
+    content = 'lorem ipsum dolor sit amet ' * 20
+    conn = engine.connect()
+    conn.execute(metadata.tables['user'].insert(),
+            [{'id': i, 'name': 'user%d' % i} for i in range(1, users + 1)])
+    conn.execute(metadata.tables['post'].insert(),
+            [{'id': i, 'user_id': i % users + 1, 'created': 1300000000 + i, 'content': content,
+                'title': 'post %d' % i} for i in range(1, rows + 1)])
+    conn.execute(metadata.tables['comment'].insert(),
+            [{'id': i, 'user_id': i % users + 1, 'post_id': (i - 1) // 2 + 1, 'content': 'comment %d' % i}
+                for i in range(1, rows * 2 + 1)])
+    conn.close()
+    engine.dispose()
+    return users
+
+def percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100.0))]
+
+def measure(redis, call, args):
+    """
+    run call(arg) for each of args, returns the stats of them
+    """
+    queries = []
+    listener = lambda event: event.type == 'query' and queries.append(event)
+    thing.Thing.add_listener(listener)
+    round_trips = redis.round_trips
+    latencies = []
+    timer = timeit.default_timer
+    try:
+        start_time = timer()
+        for arg in args:
+            call_start = timer()
+            call(arg)
+            latencies.append(timer() - call_start)
+        seconds = timer() - start_time
+    finally:
+        thing.Thing.remove_listener(listener)
+    count = len(args)
+    return {
+            'calls': count,
+            'seconds': round(seconds, 6),
+            'throughput': round(count / seconds, 2) if seconds else None,
+            'p50_ms': round(percentile(latencies, 50) * 1000, 4),
+            'p99_ms': round(percentile(latencies, 99) * 1000, 4),
+            'queries_per_call': round(len(queries) / float(count), 4),
+            'cache_round_trips_per_call': round((redis.round_trips - round_trips) / float(count), 4),
+            }
+
+def operations(rows, users):
+    """
+    name => (call, args, is_read)
+    """
+    posts = list(range(1, rows + 1))
+    user_ids = list(range(1, users + 1))
+    chunks = [posts[i:i + 20] for i in range(0, len(posts), 20)]
+
+    def save(pk):
+        post = Post().find(pk)
+        post.title = 'post %d updated' % pk
+        post.save()
+
+    return [
+            ('find', lambda pk: Post().find(pk).title, posts, True),
+            ('find_many', lambda pks: Post().find_many(pks).to_list(), chunks, True),
+            ('findall', lambda user_id: Post().where('user_id', '=', user_id).order_by('-id').findall(limit = 20).to_list(),
+                user_ids, True),
+            ('findall_by', lambda user_id: Post().findall_by_user_id(user_id, limit = 20).to_list(), user_ids, True),
+            ('count_by', lambda user_id: Post().count_by_user_id(user_id), user_ids, True),
+            ('belongs_to', lambda pk: Comment().find(pk).post.title, posts, True),
+            ('has_many', lambda user_id: User().find(user_id).posts.findall(limit = 20).to_list(), user_ids, True),
+            ('preload', lambda pks: Post().where('id', 'in', pks).preload('author', 'comments').findall().to_list(),
+                chunks, True),
+            ('save', save, posts, False),
+            ]
+
+def run(url = None, rows = 2000, iterations = 1):
+    """
+    returns benchmark results as a dict
+    """
+    tmpdir = None
+    if url is None:
+        tmpdir = tempfile.mkdtemp(prefix = 'thing-benchmark-')
+        url = 'sqlite:///%s' % os.path.join(tmpdir, 'benchmark.db')
+    try:
+        users = seed(url, rows)
+        redis = LocalRedis()
+        thing.Thing._table_schemas = {}
+        thing.Thing.config({
+            'db': {
+                'master': {'url': url},
+                'slave': {'url': url},
+                },
+            'redis': {'client': redis},
+            'thing': {'debug': False},
+            })
+        thing.Thing.warmup(['user', 'post', 'comment'])
+
+        results = {}
+        for i in range(iterations):
+            for name, call, args, is_read in operations(rows, users):
+                redis.flushdb()
+                result = results.setdefault(name, {})
+                variants = ('cold', 'warm') if is_read else ('write', )
+                for variant in variants:
+                    stats = measure(redis, call, args)
+                    # keep the best run of each variant
+                    if variant not in result or stats['throughput'] > result[variant]['throughput']:
+                        result[variant] = stats
+
+        for engine in thing.Thing._db_conn.values():
+            engine.dispose()
+        return {
+                'meta': {
+                    'thing': package.__version__,
+                    'python': platform.python_version(),
+                    'sqlalchemy': sqlalchemy.__version__,
+                    'dialect': url.split(':', 1)[0],
+                    'rows': rows,
+                    'iterations': iterations,
+                    'time': int(time.time()),
+                    },
+                'results': results,
+                }
+    finally:
+        if tmpdir:
+            shutil.rmtree(tmpdir, ignore_errors = True)
+
+def main(argv):
+    options = {'--url': None, '--rows': '2000', '--iterations': '1', '--output': None}
+    args = list(argv)
+    while args:
+        name = args.pop(0)
+        if name not in options or not args:
+            print(__doc__.strip())
+            return 1
+        options[name] = args.pop(0)
+
+    report = run(options['--url'], int(options['--rows']), int(options['--iterations']))
+    data = json.dumps(report, indent = 2, sort_keys = True)
+    if options['--output']:
+        with open(options['--output'], 'w') as f:
+            f.write(data)
+        print('results saved into %s' % options['--output'])
+    else:
+        print(data)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))